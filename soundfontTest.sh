@@ -1,8 +1,8 @@
 #!/bin/bash
 
-midi_dir=${1:-~/MIDI/}
+midi_dir=~/MIDI/
 
-# Set to false to disable .csv output
+# Set to false to disable .csv output (or pass -v)
 debug=false
 
 # Function to display usage
@@ -14,13 +14,14 @@ usage() {
   echo " "
   echo "    Options:"
   echo "          -h        Display this help message"
+  echo "          -v        Enable debug mode (convert each track to .csv in tmp/)"
   echo "          -d DIR    Specify the MIDI directory to use (default: ~/MIDI/)"
   echo " "
   exit 0
 }
 
 # Check for parameter
-while getopts "hd:" opt; do
+while getopts "hvd:" opt; do
   case ${opt} in
     h )
       usage
@@ -39,38 +40,52 @@ while getopts "hd:" opt; do
 done
 shift $((OPTIND -1))
 
-# Kill fluidsynth
-killall fluidsynth >/dev/null 2>&1
-if pidof pulseaudio; then
-  pulseaudio -k
+# Debug mode needs midicsv for its .csv conversions
+if [ "$debug" = true ] && ! hash midicsv; then
+  echo "Debug mode (-v) needs midicsv, please install it or run without -v." 1>&2
+  exit 1
 fi
 
+# A directory can also be given as a plain argument, after any options
+if [[ -n "$1" ]]; then
+  midi_dir="$1"
+fi
+
+# Check for the required commands once; hash also remembers their paths for the rest of the run
+if ! hash fluidsynth find shuf; then
+  echo "Please install the missing commands listed above (see README.md)." 1>&2
+  exit 1
+fi
+
+# Kill fluidsynth and restart pulseaudio (-k is a no-op when no daemon is running).
+# This runs in the background, overlapping with the file scans below.
+{
+  killall fluidsynth >/dev/null 2>&1
+  pulseaudio -k >/dev/null 2>&1
+} &
+audio_reset_pid=$!
+
+# Function to find MIDI files (NUL-separated, single pass over the tree)
 find_midi_files() {
-    find "$midi_dir" -type f -iname '*.mid' -o -iname '*.midi'
+  find "$midi_dir" -type f \( -iname '*.mid' -o -iname '*.midi' \) -print0
 }
 
-# Function to find SoundFont files
+# Function to find SoundFont files, sorted once so the table and switching order are stable
 find_sf2_files() {
-  find /usr/share/sounds/sf2/ -type f -iname "*.sf2"
+  find /usr/share/sounds/sf2/ -type f -iname "*.sf2" -print0 | sort -z
 }
 
-  # Set color codes for output
-  red='\033[3;90m'
-  bright_red='\033[0;91m'
-  cyan='\033[2;96m'
-  magenta='\033[0;35m'
-  black='\033[0;30m'
-  green='\033[0;32m'
-  yellow='\033[0;33m'
-  blue='\033[0;34m'
-  purple='\033[0;35m'
-  white='\033[0;37m'
-  grey='\033[0;90m'
-  lgrey='\033[3;31m'
-  orange='\033[0;33m'
-  light_yellow='\e[93m'
-  highlight='\u001b[46m'
-  nocolor='\033[0m'
+  # Set color codes for output (escape sequences are resolved once, here)
+  red=$'\e[3;90m'
+  bright_red=$'\e[0;91m'
+  cyan=$'\e[2;96m'
+  magenta=$'\e[0;35m'
+  yellow=$'\e[0;33m'
+  blue=$'\e[0;34m'
+  grey=$'\e[0;90m'
+  light_yellow=$'\e[93m'
+  highlight=$'\e[46m'
+  nocolor=$'\e[0m'
 
 display_metadata() {
   
@@ -82,51 +97,73 @@ display_metadata() {
   track_text=$(echo -e "$1" | fold -s -w $col_width)
   next_track_text=$(echo -e "${3:-None}" | fold -s -w $col_width)
   
-  # Pad shorter text with spaces to fill the column width
-  sf2_text=$(printf "%-${col_width}s" "$sf2_text")
-  track_text=$(printf "%-${col_width}s" "$track_text")
-  next_track_text=$(printf "%-${col_width}s" "$next_track_text")
-  
-  # Print table headers
-  printf "${blue}%-${col_width}s ${yellow}%-${col_width}s ${magenta}%-${col_width}s ${nocolor}\n" "SoundFont" "Track" "Next Track"
-  printf "${blue}%-${col_width}s ${yellow}%-${col_width}s ${magenta}%-${col_width}s ${nocolor}\n" "---------" "-----" "----------"
+  # Print table headers (printf repeats the format for each group of three arguments)
+  printf "${blue}%-${col_width}s ${yellow}%-${col_width}s ${magenta}%-${col_width}s ${nocolor}\n" \
+    "SoundFont" "Track" "Next Track" "---------" "-----" "----------"
   
-  # Print wrapped and padded text for each row
-  for ((i=1; i<=6; i++)); do
-    sf2_row=$(echo "$sf2_text" | sed "${i}q;d")
-    track_row=$(echo "$track_text" | sed "${i}q;d")
-    next_track_row=$(echo "$next_track_text" | sed "${i}q;d")
-    printf "${cyan}%-${col_width}s ${light_yellow}%-${col_width}s ${grey}%-${col_width}s ${nocolor}\n" "$sf2_row" "$track_row" "$next_track_row"
+  # Split the wrapped text into lines once so each row is a direct array lookup
+  mapfile -t sf2_rows <<< "$sf2_text"
+  mapfile -t track_rows <<< "$track_text"
+  mapfile -t next_track_rows <<< "$next_track_text"
+
+  # Print wrapped and padded text for all rows in one call
+  rows=()
+  for ((i=0; i<6; i++)); do
+    rows+=("${sf2_rows[i]}" "${track_rows[i]}" "${next_track_rows[i]}")
   done
-  
+  printf "${cyan}%-${col_width}s ${light_yellow}%-${col_width}s ${grey}%-${col_width}s ${nocolor}\n" "${rows[@]}"
+
   # Add empty line at the end
   printf "\n"
   
 }
 
+# Function to wait for a control key or the end of playback. The action is left in $input
+# (rather than echoed into a $(...) subshell) so no extra process is forked per track.
 handle_input() {
-    while [ -n "$(pgrep fluidsynth)" ]; do
-        read -rsn1 -t 1 input
-        if [[ "$input" == "." ]]; then
-            echo "next"
-            return 0
-        elif [[ "$input" == "," ]]; then
-            echo "prev"
-            return 0
-        elif [[ "$input" == "s" ]]; then
-            echo "sf2"
+    # kill -0 is a builtin check on our own fluidsynth, no process is spawned per poll
+    while kill -0 "$fluidsynth_pid" 2>/dev/null; do
+        # A key read while coalescing a skip burst is handled before reading a new one
+        if [[ -n "$pending_key" ]]; then
+            key="$pending_key"
+            pending_key=""
+        else
+            read -rsn1 -t 1 key
+        fi
+        if [[ "$key" == "." || "$key" == "," ]]; then
+            # Coalesce a burst of (.)/(,) presses into one jump, so holding a key
+            # doesn't start and kill fluidsynth once per skipped track
+            skip=0
+            while true; do
+                if [[ "$key" == "." ]]; then
+                    skip=$((skip + 1))
+                elif [[ "$key" == "," ]]; then
+                    skip=$((skip - 1))
+                else
+                    pending_key="$key"
+                    break
+                fi
+                read -rsn1 -t 0.15 key || break
+            done
+            # Presses that cancel out leave the current track playing
+            if [[ "$skip" -ne 0 ]]; then
+                input="skip $skip"
+                return 0
+            fi
+        elif [[ "$key" == "s" ]]; then
+            input="sf2"
             return 0
-        elif [[ "$input" == "o" ]]; then
-            echo "save"
+        elif [[ "$key" == "o" ]]; then
+            input="save"
             return 0
-        elif [[ "$input" == "q" ]]; then
-            echo "quit"
+        elif [[ "$key" == "q" ]]; then
+            input="quit"
             return 0
         fi
     done
 
     # If fluidsynth is not running, return an empty string
-    echo ""
+    input=""
     return 0
 }
 
@@ -141,40 +178,92 @@ display_menu() {
 
 # Function to save the current track as an mp3
 save_track() {
-  case "$current_track" in
-    *.mid) current_track_basename=$(basename "$current_track" .mid);;
-    *.MID) current_track_basename=$(basename "$current_track" .MID);;
-    *) echo "Error: Invalid file extension for MIDI file.";;
-  esac
-  current_track_basename=$(basename "$current_track" .mid)
-  sf2_basename=$(basename "$current_sf2")
-  sf2_basename="${sf2_basename%.*}"
-  output_dir="$(dirname "$0")/Output"
-  output_file="$output_dir/$current_track_basename-$sf2_basename.mp3"
+  # Only run one export at a time. Checked before naming the file, so the status line
+  # keeps showing the export that is actually running
+  if kill -0 "$save_pid" 2>/dev/null; then
+    echo "An export is already running, please wait for it to finish."
+    return
+  fi
 
-  # Kill fluidsynth to ensure that the correct soundfont is used for conversion
-  killall fluidsynth >/dev/null 2>&1
+  # lame is only needed for exports, so check for it here rather than at startup
+  if ! hash lame 2>/dev/null; then
+    echo "lame is required to save tracks as MP3, please install it."
+    return
+  fi
+
+  current_track_basename="${current_track##*/}"
+  current_track_basename="${current_track_basename%.*}"
+  sf2_basename="${sf2_files_list[$current_sf2_index]%.*}"
+  output_file="$output_dir/$current_track_basename-$sf2_basename.mp3"
 
   # Create Output folder if it doesn't exist
   if [ ! -d "$output_dir" ]; then
     mkdir "$output_dir"
   fi
 
-  echo "Saving track as $output_file..."
-  sf2_current=$(basename "$current_sf2" .sf2)
-  fluidsynth -F "$output_dir/$current_track_basename-$sf2_current.wav" "$current_sf2" "$current_track" | lame - "$output_file"
-  find "$output_dir" -type f -name '*.wav' | while read file; do
-    output_file="${file%.*}.mp3"
-    lame "$file" "$output_file"
-done
-  echo "Track saved to $output_dir."
-  echo "Cleaning up temporary files..."
-  rm "$output_dir"/*.wav
+  echo "Saving track as $output_file in the background..."
+  # Render raw 16-bit PCM to stdout and encode it as it arrives, no intermediate .wav
+  # The export runs in its own process group (setsid) so cleanup can stop the whole pipeline,
+  # and writes to a .part file that is only renamed once both fluidsynth and lame succeed
+  setsid bash -c '
+    set -o pipefail
+    if fluidsynth -q -T raw -F - -r 44100 "$1" "$2" 2>/dev/null \
+      | lame --quiet -r -s 44.1 --bitwidth 16 --signed --little-endian - "$3.part"; then
+      mv "$3.part" "$3"
+      notify-send "Track saved to MP3" "$3"
+    else
+      rm -f "$3.part"
+      notify-send "MP3 export failed" "$3"
+    fi
+  ' save_track "$current_sf2" "$current_track" "$output_file" >/dev/null 2>&1 &
+  save_pid=$!
+}
+
+# Function to convert a MIDI file to .csv for debugging
+convert_to_csv() {
+  # Reuse the .csv from an earlier conversion unless the MIDI file has changed since
+  # (or while a conversion of it is still running)
+  if [[ -z "${csv_cache[$1]}" ]] || [[ ! "${csv_cache[$1]}" -nt "$1" && ! -e "${csv_cache[$1]}.part" ]]; then
+    # create tmp directory and a temporary directory inside it once per session
+    if [[ -z "$temp_dir" ]]; then
+      mkdir -p tmp
+      temp_dir=$(mktemp -d -p "$(pwd)/tmp")
+    fi
+
+    # convert to CSV in the background so the controls respond straight away. The .csv
+    # only appears once midicsv succeeds, so a failed conversion is retried next time.
+    csv_cache[$1]="${csv_cache[$1]:-$temp_dir/${#csv_cache[@]}.csv}"
+    csv_file="${csv_cache[$1]}"
+    : > "$csv_file.part"
+    {
+      if midicsv "$1" > "$csv_file.part" 2>"$csv_file.err"; then
+        mv "$csv_file.part" "$csv_file"
+        rm -f "$csv_file.err"
+      else
+        rm -f "$csv_file.part" "$csv_file"
+      fi
+    } &
+  fi
 }
 
 # Function to clean up when the script exits
 cleanup() {
-  clear
+  # Forked children (e.g. a background fluidsynth before it execs) inherit the EXIT trap,
+  # only the main shell may tear the session down
+  [[ $BASHPID -eq $$ ]] || exit
+  printf '%s' "$clear_screen"
+  echo "Stopping running processes..."
+  # Signal all of our background jobs (playback, export, .csv conversions) at once,
+  # before the temporary directories they may be writing to are removed
+  kill $(jobs -p) >/dev/null 2>&1
+  # The export's fluidsynth | lame pipeline is in its own process group, stop all of it and
+  # drop the unfinished MP3
+  if [[ -n "$save_pid" ]]; then
+    kill -- -"$save_pid" >/dev/null 2>&1
+    rm -f "$output_file.part"
+  fi
+  killall fluidsynth >/dev/null 2>&1
+  pulseaudio -k >/dev/null 2>&1
   echo "Deleting Temporary Directories..."
   if [[ -d "$temp_dir" ]]; then
     rm -r "$temp_dir"
@@ -182,84 +271,123 @@ cleanup() {
   if [ -d "tmp" ]; then
     rm -r tmp
   fi
-  find "." -type d -name 'tmp.*' -exec rm -r {} \; >/dev/null 2>&1
-  echo "Stopping running processes..."
-  killall fluidsynth
-  if pidof pulseaudio; then
-    pulseaudio -k
-  fi
   echo "Done."
 }
 
+# Ask clear(1) for this terminal's clear sequence once, every redraw then just prints it
+clear_screen=$(clear)
+
+# Show something straight away, the scan can take a while on large directories
+printf '%s' "$clear_screen"
+echo "Scanning $midi_dir for MIDI files..."
+
+# Start the SoundFont scan in the background so it overlaps with the MIDI scan
+exec {sf2_fd}< <(find_sf2_files)
+mapfile -d '' shuffled_midi_files < <(find_midi_files | shuf -z)
+mapfile -d '' -u "$sf2_fd" sf2_files
+exec {sf2_fd}<&-
+
+# Without files the play loop would spin restarting fluidsynth, so stop here instead
+if [[ ${#shuffled_midi_files[@]} -eq 0 ]]; then
+  echo "No MIDI files found in $midi_dir" 1>&2
+  exit 1
+fi
+if [[ ${#sf2_files[@]} -eq 0 ]]; then
+  echo "No SoundFonts found in /usr/share/sounds/sf2/" 1>&2
+  exit 1
+fi
+
 # Set up trap to call cleanup function when the script exits
 trap cleanup EXIT
+# Build the list of SoundFont names shown in the table once, in a single pass
+sf2_files_list=("${sf2_files[@]##*/}")
 
-shuffled_midi_files=()
-while IFS= read -r -d '' file; do
-  shuffled_midi_files+=("$file")
-done < <(find "$midi_dir" -type f \( -iname "*.mid" -o -iname "*.midi" \) -print0 | shuf -z)
+# The table layout only depends on the list, so work it out once as well
+sf2_columns=5  # number of columns to display
+sf2_max_per_col=$(( (${#sf2_files_list[@]} + sf2_columns - 1) / sf2_columns ))  # maximum number of items per column
+sf2_width=$(( (90 - sf2_columns + 1) / sf2_columns ))  # width of each column, including the tab character
+
+# Pad (and trim) every table cell to the column width once, rather than on every redraw
+sf2_cells=()
+for sf2 in "${sf2_files_list[@]}"; do
+  printf -v cell "%-${sf2_width}.${sf2_width}s" "$sf2"
+  sf2_cells+=("$cell")
+done
+printf -v sf2_empty_cell "%-${sf2_width}s" ""
+
+# Load and clean up the trivia once, then pick a line at random on each redraw
+trivia=()
+if [ -f "trivia.txt" ]; then
+  mapfile -t trivia < <(sed 's/\r//g;s/^ *//;s/ *$//;/^$/d;s/.$//' trivia.txt)
+fi
+
+# MP3 exports go next to the script; work out its directory once without spawning dirname
+script_dir="${0%/*}"
+[[ "$script_dir" == "$0" ]] && script_dir="."
+output_dir="$script_dir/Output"
 
-sf2_files=($(find_sf2_files))
 current_track_index=0
+track_count=${#shuffled_midi_files[@]}
 current_sf2_index=0
 
+# Debug .csv conversions, keyed by MIDI path and reused while newer than the MIDI file
+declare -A csv_cache=()
+
 play() {
   while true; do
     current_track="${shuffled_midi_files[$current_track_index]}"
-    next_track="${shuffled_midi_files[$((current_track_index + 1))]}"
+    next_track="${shuffled_midi_files[$(( (current_track_index + 1) % track_count ))]}"
     current_sf2="${sf2_files[$current_sf2_index]}"
-    sf2_basename=$(basename "$current_sf2")
 
-    clear
+    printf '%s' "$clear_screen"
 
     echo "Midi Soundfont Testing Program v1.3.1"
     echo " "
     echo " "
     display_metadata "$current_track" "$current_sf2" "$next_track"
-    echo -e "Track ${yellow}$((current_track_index + 1)) ${nocolor}of ${yellow}${#shuffled_midi_files[@]}${nocolor}"
+    echo "Track ${yellow}$((current_track_index + 1)) ${nocolor}of ${yellow}${track_count}${nocolor}"
 
     echo " "
     
     # Display available sf2
-    echo -e "${blue}Available Soundfonts${nocolor}"
-    echo -e "${blue}--------------------${nocolor}"
-    
-    sf2_files_list=($(find /usr/share/sounds/sf2/ -type f -iname "*.sf2" -printf "%f\n"))
-    sf2_columns=5  # number of columns to display
-    sf2_max_per_col=$(( (${#sf2_files_list[@]} + sf2_columns - 1) / sf2_columns ))  # maximum number of items per column
-    sf2_width=$(( (90 - sf2_columns + 1) / sf2_columns ))  # width of each column, including the tab character
+    echo "${blue}Available Soundfonts${nocolor}"
+    echo "${blue}--------------------${nocolor}"
     
+    # Build the whole table in memory and write it to the terminal in one go
+    sf2_table=""
     for (( col=0; col<sf2_columns; col++ )); do
       for (( row=0; row<sf2_max_per_col; row++ )); do
         index=$((col * sf2_max_per_col + row))
         if [[ "$index" -lt "${#sf2_files_list[@]}" ]]; then
-          sf2="${sf2_files_list[$index]}"
-          if [[ "$sf2" == "$sf2_basename" ]]; then
+          if [[ "$index" -eq "$current_sf2_index" ]]; then
             # Highlight the current .sf2 file in the list using ANSI color codes
-            printf "${nocolor}${highlight}"
+            sf2_table+="${nocolor}${highlight}"
           else
-            printf "${grey}"
+            sf2_table+="${grey}"
           fi
-          printf "%-${sf2_width}s" "$sf2"
-          printf "${nocolor}\t"
+          sf2_table+="${sf2_cells[$index]}${nocolor}"$'\t'
         else
           # Print empty space to fill the last row
-          printf "%-${sf2_width}s" ""
-          printf "${nocolor}\t"
+          sf2_table+="${sf2_empty_cell}${nocolor}"$'\t'
         fi
       done
-      printf "\n"
+      sf2_table+=$'\n'
     done
+    printf '%s' "$sf2_table"
 
     echo " "
-    if [ -f "trivia.txt" ]; then
-      echo -e "${bright_red}Trivia"
-      echo -e "------"
-      echo -e "${red}$(shuf -n 1 trivia.txt | tr -d '\r' | sed 's/^ *//;s/ *$//' | sed 's/.\{1\}$//').\033[0m" | fold -s -w 90
-      echo -e "${nocolor} "
+    if [[ ${#trivia[@]} -gt 0 ]]; then
+      echo "${bright_red}Trivia"
+      echo "------"
+      echo "${red}${trivia[RANDOM % ${#trivia[@]}]}.${nocolor}" | fold -s -w 90
+      echo "${nocolor} "
     fi
     display_menu
       echo " "
+    # Keep reporting a background export across redraws until it finishes
+    if kill -0 "$save_pid" 2>/dev/null; then
+      echo "Saving track as $output_file in the background..."
+    fi
 
     # Start fluidsynth
     fluidsynth -a pulseaudio -m alsa_seq -l -i "$current_sf2" "$current_track" >/dev/null 2>&1 &
@@ -268,36 +396,51 @@ play() {
   
     if [ "$debug" = true ]; then
       echo " "
-      # create tmp directory if it doesn't exist and create temporary directory inside tmp
-      mkdir -p tmp
-      temp_dir=$(mktemp -d -p "$(pwd)/tmp")
-      echo -e "${grey}Temporary working directory: $temp_dir"
-      
-      # convert to CSV
-      midicsv "$current_track" > "$temp_dir/data.csv"
-      echo -e "Converted .mid to .csv > $temp_dir""/data.csv ${nocolor}"
+      convert_to_csv "$current_track"
+      # Convert the next track as well, so its .csv is ready by the time it plays
+      if [[ -n "$next_track" ]]; then
+        convert_to_csv "$next_track"
+      fi
+      echo "${grey}Temporary working directory: $temp_dir"
+      csv_file="${csv_cache[$current_track]}"
+      if [[ -e "$csv_file.part" ]]; then
+        echo "Converting .mid to .csv > $csv_file ${nocolor}"
+      elif [[ -f "$csv_file" ]]; then
+        echo "Converted .mid to .csv > $csv_file ${nocolor}"
+      else
+        echo "midicsv failed, see $csv_file.err ${nocolor}"
+      fi
     fi
   
-    input=$(handle_input 2)  # Wait for up to 5 seconds for user input
-    if [[ "$input" == "next" ]]; then
-      kill $fluidsynth_pid
-      current_track_index=$((current_track_index + 1))
-    elif [[ "$input" == "prev" ]]; then
+    handle_input
+    # Saving runs in the background, so keep playing the current track meanwhile
+    while [[ "$input" == "save" ]]; do
+      save_track
+      handle_input
+    done
+    if [[ "$input" == skip* ]]; then
       kill $fluidsynth_pid
-      current_track_index=$((current_track_index - 1))
+      # Wrap around both ends of the list, so (,) on the first track goes to the last
+      current_track_index=$(( ( (current_track_index + ${input#skip }) % track_count + track_count ) % track_count ))
+      # An (s) or (q) pressed at the end of the burst is applied here, rather than by killing
+      # the next fluidsynth straight after it has been started
+      if [[ "$pending_key" == "s" ]]; then
+        pending_key=""
+        current_sf2_index=$((current_sf2_index + 1))
+        current_sf2_index=$((current_sf2_index % ${#sf2_files[@]}))
+      elif [[ "$pending_key" == "q" ]]; then
+        exit 0
+      fi
     elif [[ "$input" == "quit" ]]; then
-      cleanup
+      # cleanup runs from the EXIT trap
       exit 0
-    elif [[ "$input" == "save" ]]; then
-      save_track
-      notify-send "Track saved to MP3" "$current_track"
     elif [[ "$input" == "sf2" ]]; then
       kill $fluidsynth_pid
       current_sf2_index=$((current_sf2_index + 1))
       current_sf2_index=$((current_sf2_index % ${#sf2_files[@]}))
     elif [[ "$input" == "" ]]; then
         kill $fluidsynth_pid
-        current_track_index=$((current_track_index + 1))
+        current_track_index=$(( (current_track_index + 1) % track_count ))
     fi
   
   done
@@ -306,6 +449,8 @@ play() {
         
 }
 
+# Make sure the audio reset has finished before the first track starts
+wait "$audio_reset_pid"
 play
 
 